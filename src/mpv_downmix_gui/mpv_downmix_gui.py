@@ -34,6 +34,12 @@ import time
 import logging
 import atexit
 import json
+import queue
+import threading
+import functools
+import typing
+import struct
+import signal
 
 import tkinter as tk
 from tkinter import ttk
@@ -45,6 +51,8 @@ from . import python_mpv_jsonipc
 
 from . import downmix_rfc7845
 
+log = logging.getLogger('mpv-downmix-gui')
+
 
 
 def get_channel_volume(coefficients, channel):
@@ -73,10 +81,35 @@ def get_config_value(downmix_config, frame_id, channel_name):
     #print("get_config_value value", frame_id, channel_name, value)
     return value
 
-def get_left_right_coefficient(volume, balance):
-    return (
-        (((1 - balance) * volume) / 2),
-        (((1 + balance) * volume) / 2),
+@functools.lru_cache(maxsize=64)
+def get_cached_coefficients(input_channel_layout):
+    return downmix_rfc7845.get_coefficients(input_channel_layout)
+
+def get_coefficients(input_channel_layout):
+    "copy of the cached rfc7845 coefficients. the copy is modified by the gui"
+    coefficients = get_cached_coefficients(input_channel_layout)
+    if coefficients is None:
+        return None
+    return {output: dict(inputs) for output, inputs in coefficients.items()}
+
+
+
+class ChannelLayout(typing.NamedTuple):
+    "channel names, and their (row_idx, col_idx) positions in the 3x3 grid"
+    names: tuple
+    positions: tuple
+
+def layout(*rows):
+    "build a ChannelLayout from rows of the 3x3 grid. None is an empty cell"
+    cells = [
+        (channel_name, (row_idx, col_idx))
+        for row_idx, row in enumerate(rows)
+        for col_idx, channel_name in enumerate(row)
+        if channel_name
+    ]
+    return ChannelLayout(
+        names=tuple(channel_name for channel_name, _ in cells),
+        positions=tuple(position for _, position in cells),
     )
 
 
@@ -88,7 +121,7 @@ input_channel_names_by_layout = dict()
 N = input_channel_names_by_layout
 
 # empty            ()
-N["empty"] = (
+N["empty"] = layout(
     (None, None, None),
     (None, None, None),
     (None, None, None),
@@ -96,7 +129,7 @@ N["empty"] = (
 
 # mono             (fc)
 # 1.0              (fc)
-N["mono"] = N["1.0"] = (
+N["mono"] = layout(
     (None, "FC", None),
     (None, None, None),
     (None, None, None),
@@ -104,28 +137,28 @@ N["mono"] = N["1.0"] = (
 
 # stereo           (fl-fr)
 # 2.0              (fl-fr)
-N["stereo"] = N["2.0"] = (
+N["stereo"] = layout(
     ("FL", None, "FR"),
     (None, None, None),
     (None, None, None),
 )
 
 # 2.1              (fl-fr-lfe)
-N["2.1"] = (
+N["2.1"] = layout(
     ("FL", None, "FR"),
     (None, "LFE", None),
     (None, None, None),
 )
 
 # 3.0              (fl-fr-fc)
-N["3.0"] = (
+N["3.0"] = layout(
     ("FL", "FC", "FR"),
     (None, None, None),
     (None, None, None),
 )
 
 # 3.0(back)        (fl-fr-bc)
-N["3.0(back)"] = (
+N["3.0(back)"] = layout(
     ("FL", None, "FR"),
     (None, None, None),
     (None, "BC", None),
@@ -133,28 +166,28 @@ N["3.0(back)"] = (
 
 # 3.1              (fl-fr-fc-lfe)
 # left, center, right, LFE
-N["3.1"] = (
+N["3.1"] = layout(
     ("FL", "FC", "FR"),
     (None, "LFE", None),
     (None, None, None),
 )
 
 # 3.1(back)        (fl-fr-lfe-bc)
-N["3.1(back)"] = (
+N["3.1(back)"] = layout(
     ("FL", None, "FR"),
     (None, "LFE", None),
     (None, "BC", None),
 )
 
 # 4.0              (fl-fr-fc-bc)
-N["4.0"] = (
+N["4.0"] = layout(
     ("FL", "FC", "FR"),
     (None, None, None),
     (None, "BC", None),
 )
 
 # 4.1              (fl-fr-fc-lfe-bc)
-N["4.1"] = (
+N["4.1"] = layout(
     ("FL", "FC", "FR"),
     (None, "LFE", None),
     (None, "BC", None),
@@ -163,7 +196,7 @@ N["4.1"] = (
 # quad             (fl-fr-bl-br)
 # Quadraphonic Channel Mapping: FL FR BL BR
 # front left, front right, back left, back right
-N["quad"] = (
+N["quad"] = layout(
     ("FL", None, "FR"),
     (None, None, None),
     ("BL", None, "BR"),
@@ -171,14 +204,14 @@ N["quad"] = (
 
 # 4.1(alsa)        (fl-fr-bl-br-lfe)
 # quad + LFE
-N["4.1(alsa)"] = (
+N["4.1(alsa)"] = layout(
     ("FL", None, "FR"),
     (None, "LFE", None),
     ("BL", None, "BR"),
 )
 
 # quad(side)       (fl-fr-sl-sr)
-N["quad(side)"] = (
+N["quad(side)"] = layout(
     ("FL", None, "FR"),
     ("SL", None, "SR"),
     (None, None, None),
@@ -189,14 +222,14 @@ N["quad(side)"] = (
 # 5.0 Surround Mapping: FL FC FR RL RR
 # 5.1 without LFE
 # front left, front center, front right, back left, back right
-N["5.0"] = N["5.0(alsa)"] = (
+N["5.0"] = layout(
     ("FL", "FC", "FR"),
     (None, None, None),
     ("BL", None, "BR"),
 )
 
 # 5.0(side)        (fl-fr-fc-sl-sr)
-N["5.0(side)"] = (
+N["5.0(side)"] = layout(
     ("FL", "FC", "FR"),
     ("SL", None, "SR"),
     (None, None, None),
@@ -207,21 +240,21 @@ N["5.0(side)"] = (
 # 5.1 Surround Mapping: FL FC FR RL RR LFE
 # front left, front center, front right, back left, back right, LFE
 # note: ffmpeg says "back" instead of "rear" -> "BL" instead of "RL"
-N["5.1"] = N["5.1(alsa)"] = (
+N["5.1"] = layout(
     ("FL", "FC", "FR"),
     (None, "LFE", None),
     ("BL", None, "BR"),
 )
 
 # 5.1(side)        (fl-fr-fc-lfe-sl-sr)
-N["5.1(side)"] = (
+N["5.1(side)"] = layout(
     ("FL", "FC", "FR"),
     ("SL", "LFE", "SR"),
     (None, None, None),
 )
 
 # 6.0              (fl-fr-fc-bc-sl-sr)
-N["6.0"] = (
+N["6.0"] = layout(
     ("FL", "FC", "FR"),
     ("SL", None, "SR"),
     (None, "BC", None),
@@ -231,7 +264,7 @@ N["6.0"] = (
 # FIXME does not fit into 3x3 grid
 
 # hexagonal        (fl-fr-fc-bl-br-bc)
-N["hexagonal"] = (
+N["hexagonal"] = layout(
     ("FL", "FC", "FR"),
     (None, None, None),
     ("BL", "BC", "BR"),
@@ -241,7 +274,7 @@ N["hexagonal"] = (
 # 6.1 Surround Mapping: FL FC FR SL SR BC LFE
 # front left, front center, front right, side left, side right, back center, LFE
 # 5.1 + back center, "back" -> "side"
-N["6.1"] = (
+N["6.1"] = layout(
     ("FL", "FC", "FR"),
     ("SL", "LFE", "SR"),
     (None, "BC", None),
@@ -249,7 +282,7 @@ N["6.1"] = (
 
 # 6.1(back)        (fl-fr-fc-lfe-bl-br-bc)
 # hexagonal + LFE
-N["6.1(back)"] = (
+N["6.1(back)"] = layout(
     ("FL", "FC", "FR"),
     (None, "LFE", None),
     ("BL", "BC", "BR"),
@@ -262,7 +295,7 @@ N["6.1(back)"] = (
 # FIXME does not fit into 3x3 grid
 
 # 7.0              (fl-fr-fc-bl-br-sl-sr)
-N["7.0"] = (
+N["7.0"] = layout(
     ("FL", "FC", "FR"),
     ("SL", None, "SR"),
     ("BL", None, "BR"),
@@ -279,7 +312,7 @@ N["7.0"] = (
 # 7.1 Surround Mapping: FL FC FR SL SR BL BR LFE
 # front left, front center, front right, side left, side right, back left, back right, LFE
 # 6.1 + BC -> BL BR
-N["7.1"] = N["7.1(alsa)"] = (
+N["7.1"] = layout(
     ("FL", "FC", "FR"),
     ("SL", "LFE", "SR"),
     ("BL", None, "BR"),
@@ -300,7 +333,7 @@ N["7.1"] = N["7.1(alsa)"] = (
 # 8.1 Surround Mapping: FL FC FR SL SR BL BC BR LFE
 # front left, front center, front right, side left, side right, back left, back right, LFE
 # 7.1 + BC
-N["8.1"] = (
+N["8.1"] = layout(
     ("FL", "FC", "FR"),
     ("SL", "LFE", "SR"),
     ("BL", "BC", "BR"),
@@ -308,16 +341,34 @@ N["8.1"] = (
 
 # TODO more?
 
+# layouts with the same channels as another layout.
+# the target layouts are known to downmix_rfc7845,
+# mono has no coefficients (noop)
+channel_layout_alias = {
+    "1.0": "mono",
+    "2.0": "stereo",
+    "5.0(alsa)": "5.0",
+    "5.1(alsa)": "5.1",
+    "7.1(alsa)": "7.1",
+}
+
+for alias, channel_layout in channel_layout_alias.items():
+    N[alias] = N[channel_layout]
+
 
 
 def main():
 
     logging.basicConfig(
         # DEBUG:mpv-jsonipc:command list: ...
+        # DEBUG:mpv-downmix-gui:pan=stereo|...
         #level=logging.DEBUG,
+        level=logging.WARNING,
     )
 
-    if len(sys.argv) < 2:
+    args = sys.argv[1:]
+
+    if not args:
         print("error: no arguments")
         print("usage:")
         print(f"  {sys.argv[0]} mpv_arg...")
@@ -336,7 +387,7 @@ def main():
 
     downmix_config = None
 
-    for arg in sys.argv[1:]:
+    for arg in args:
         if arg.startswith("--downmix-config="):
             path = arg[17:]
             print("reading downmix config: {path!r}")
@@ -357,18 +408,44 @@ def main():
             downmix_config = None
         # ...
 
-    mpv_proc = subprocess.Popen(mpv_args)
+    # start mpv in a new session, so ctrl+c in the terminal stops only the gui.
+    # the gui then quits mpv
+    mpv_proc = subprocess.Popen(mpv_args, close_fds=True, start_new_session=True)
 
     # wait for mpv to create the ipc socket
-    time.sleep(1)
+    # poll the socket every 20 ms, so we connect as soon as mpv is ready
     mpv_ipc_client = None
-    for _ in range(10):
-        try:
-            mpv_ipc_client = python_mpv_jsonipc.MPV(start_mpv=False, ipc_socket=mpv_ipc_socket_path)
-        except FileNotFoundError:
-            time.sleep(1)
+    wait_deadline = time.monotonic() + 5
+    while time.monotonic() < wait_deadline:
+        if os.path.exists(mpv_ipc_socket_path):
+            s = socket.socket(socket.AF_UNIX)
+            s.settimeout(0.05)
+            try:
+                s.connect(mpv_ipc_socket_path)
+            except (FileNotFoundError, ConnectionRefusedError, socket.timeout):
+                pass
+            else:
+                mpv_ipc_client = python_mpv_jsonipc.MPV(start_mpv=False, ipc_socket=mpv_ipc_socket_path)
+                break
+            finally:
+                s.close()
+        if mpv_proc.poll() is not None:
+            # mpv failed to start
+            break
+        time.sleep(0.02)
     assert mpv_ipc_client, f"failed to open mpv ipc socket {mpv_ipc_socket_path}"
 
+    # larger socket buffers, so sending small json messages does not block on mpv.
+    # only raise the buffers. on linux, the default is larger than 64 KiB
+    mpv_ipc_client_socket = getattr(mpv_ipc_client.mpv_inter.socket, "socket", None)
+    if isinstance(mpv_ipc_client_socket, socket.socket):
+        try:
+            for option in (socket.SO_SNDBUF, socket.SO_RCVBUF):
+                if mpv_ipc_client_socket.getsockopt(socket.SOL_SOCKET, option) < 65536:
+                    mpv_ipc_client_socket.setsockopt(socket.SOL_SOCKET, option, 65536)
+        except OSError as exc:
+            print(f"error: failed to set mpv ipc socket buffer size: {exc}")
+
     #print("media_title", mpv_ipc_client.media_title)
     #print("time_pos", mpv_ipc_client.time_pos)
     # audio_params {'samplerate': 48000, 'channel-count': 6, 'channels': '5.1(side)', 'hr-channels': '5.1(side)', 'format': 'floatp'}
@@ -379,40 +456,122 @@ def main():
     # state
     input_channel_layout = None
     downmix_coefficients = None
-    input_channel_names = []
+    input_channel_names = input_channel_names_by_layout["empty"]
     scale_dict = dict()
+    # scales of the current layout: {channel_name: {"volume": scale, "balance": scale}}
+    channel_scales = dict()
+    # the balance scales are created when the balance tab is shown first.
+    # until then, the balance values are stored here: {channel_name: balance}
+    balance_values = dict()
+    built_frames = set()
     audio_filter = ""
+    # format string of the audio filter, for the channels of the current layout
+    audio_filter_template = ""
+    gui_config = None
     root_window = None
     show_root_window = True
+    pending_af = None
+    pending_af_timer = None
+    last_af = ""
+
+    # send ipc commands from a worker thread, so the gui does not block on mpv
+    ipc_queue = queue.Queue()
+
+    def ipc_worker():
+        while True:
+            cmd = ipc_queue.get()
+            if cmd is None:
+                break
+            try:
+                mpv_ipc_client.af_cmd(*cmd)
+            except Exception as exc:
+                print(f"error: failed to send audio filter to mpv: {exc}")
+
+    ipc_thread = threading.Thread(target=ipc_worker, daemon=True)
+    ipc_thread.start()
+
+    def flush_af():
+        nonlocal pending_af, pending_af_timer
+        af = pending_af
+        pending_af = None
+        pending_af_timer = None
+        ipc_queue.put(("set", af))
+
+    def send_af(af):
+        # coalesce fast slider changes: only send the latest filter to mpv
+        nonlocal pending_af, pending_af_timer
+        pending_af = af
+        if pending_af_timer is None:
+            pending_af_timer = root_window.after(30, flush_af)
 
     def after_change(key=None, value=None):
-        nonlocal audio_filter
-        gui_config = dict(volume={}, balance={})
-        for channel in downmix_coefficients["FL"]:
-            volume = scale_dict[f"volume.{channel}"].get()
-            balance = scale_dict[f"balance.{channel}"].get()
-            gui_config["volume"][channel] = volume
-            gui_config["balance"][channel] = balance
-            c = downmix_coefficients
-            c["FL"][channel], c["FR"][channel] = \
-                get_left_right_coefficient(volume, balance)
+        nonlocal audio_filter, gui_config, last_af
+        if downmix_coefficients is None:
+            # noop layout, for example mono. remove the downmix filter
+            audio_filter = ""
+            gui_config = None
+            if last_af:
+                last_af = ""
+                send_af("")
+            return
+        gui_volume = dict()
+        gui_balance = dict()
+        gui_config = dict(volume=gui_volume, balance=gui_balance)
+        coefficients_FL = downmix_coefficients["FL"]
+        coefficients_FR = downmix_coefficients["FR"]
+        fl_values = []
+        fr_values = []
+        for channel, scales in channel_scales.items():
+            volume = scales["volume"].get()
+            balance_scale = scales.get("balance")
+            balance = balance_scale.get() if balance_scale else balance_values[channel]
+            gui_volume[channel] = volume
+            gui_balance[channel] = balance
+            # left and right coefficient from volume and balance
+            half_volume = volume * 0.5
+            L = (1 - balance) * half_volume
+            R = (1 + balance) * half_volume
+            coefficients_FL[channel] = L
+            coefficients_FR[channel] = R
+            fl_values.append(L)
+            fr_values.append(R)
         # TODO allow top copy audio filter from gui > options
-        audio_filter = downmix_rfc7845.get_ffmpeg_audio_filter(downmix_coefficients)
-        assert audio_filter.startswith("pan=stereo|FL=")
-        gui_config_str = json.dumps(gui_config, separators=(',', ':'))
-        print("\n" + gui_config_str + "\n" + audio_filter + "\n")
+        audio_filter = audio_filter_template % (*fl_values, *fr_values)
+        if key is None:
+            # not a slider change: reset, track change, startup
+            print_downmix()
+        elif log.isEnabledFor(logging.DEBUG):
+            # printing on every slider change is slow
+            log.debug(get_gui_config_str() + " " + audio_filter)
         # wrap the value in quotes
         af = 'pan="' + audio_filter[4:] + '"'
-        mpv_ipc_client.af_cmd("set", af)
+        if af == last_af:
+            # mpv already has this filter
+            return
+        last_af = af
+        send_af(af)
+
+    def get_gui_config_str():
+        return json.dumps(gui_config, separators=(',', ':'))
+
+    def print_downmix():
+        print("\n" + get_gui_config_str() + "\n" + audio_filter + "\n")
 
     def reset_downmix_to_rfc7845():
         nonlocal input_channel_layout, downmix_coefficients, scale_dict
-        downmix_coefficients = downmix_rfc7845.get_coefficients(input_channel_layout)
+        downmix_coefficients = get_coefficients(input_channel_layout)
+        if downmix_coefficients is None:
+            # noop layout
+            after_change()
+            return
         for channel in downmix_coefficients["FL"]:
             volume = get_channel_volume(downmix_coefficients, channel)
             balance = get_channel_balance(downmix_coefficients, channel)
-            scale_dict[f"volume.{channel}"].set(volume)
-            scale_dict[f"balance.{channel}"].set(balance)
+            scales = channel_scales[channel]
+            scales["volume"].set(volume)
+            balance_values[channel] = balance
+            if "balance" in scales:
+                scales["balance"].set(balance)
         after_change()
 
     def change_audio_track(name, track):
@@ -426,31 +585,25 @@ def main():
         id = track["id"]
         channel_layout = track.get("demux-channels") # "stereo", "5.1(side)", ...
         print("change_audio_track channel_layout", channel_layout)
-        if channel_layout.startswith("unknown"):
+        if not channel_layout or str(channel_layout).startswith("unknown"):
             print(f"error: unknown channel layout {channel_layout}. set the channel layout with --audio-channels=layout, for example --audio-channels=3.1")
             num_channels = track.get("audio-channels")
             # TODO suggest possible layouts based on number of channels
             return
-
-            mpv_ipc_client.quit()
-            mpv_proc.kill()
-            if os.path.exists(mpv_ipc_socket_path):
-                os.unlink(mpv_ipc_socket_path)
-            show_root_window = False
-            if root_window:
-                root_window.close()
-            print(f"error: unknown channel layout {channel_layout}. set the channel layout with --audio-channels=layout, for example --audio-channels=3.1")
-            num_channels = track.get("audio-channels")
-            # TODO suggest possible layouts based on number of channels
-            sys.exit(1)
-        set_input_channel_layout(input_channel_layout)
+        if channel_layout_alias.get(channel_layout, channel_layout) == input_channel_layout:
+            # same layout, for example the first event after startup.
+            # keep the scales and the values of the downmix config
+            return
+        set_input_channel_layout(channel_layout)
         title = track.get("title")
         #num_channels = track["audio-channels"]
         bitrate = track.get("demux-bitrate", 0)
         codec = track.get("codec")
         print("audio track:", id, input_channel_layout, codec, bitrate/1000, title)
-        # TODO update: input_channel_layout downmix_coefficients scale_dict
-        reset_downmix_to_rfc7845()
+        if not downmix_config:
+            reset_downmix_to_rfc7845()
+        else:
+            after_change()
 
 
 
@@ -462,6 +615,12 @@ def main():
     #root_window.title("downmix: " + mpv_ipc_client.media_title)
     root_window.title("downmix")
 
+    # mpv runs in its own session, so ctrl+c in the terminal only reaches the gui.
+    # end the mainloop, then the cleanup quits mpv.
+    # python runs the handler on the next tk callback,
+    # so the audio track poll also wakes the idle mainloop
+    signal.signal(signal.SIGINT, lambda signum, frame: root_window.quit())
+
     notebook = ttk.Notebook(root_window)
     notebook.pack(pady=10, fill='both', expand=True)
 
@@ -515,10 +674,14 @@ def main():
         if not channel_layout:
             return
         print("set_input_channel_layout", repr(channel_layout))
-        input_channel_layout = channel_layout
+        input_channel_layout = channel_layout_alias.get(channel_layout, channel_layout)
         input_channel_names = input_channel_names_by_layout[input_channel_layout]
         print("set_input_channel_layout input_channel_names", repr(input_channel_names))
-        downmix_coefficients = downmix_rfc7845.get_coefficients(input_channel_layout)
+        downmix_coefficients = get_coefficients(input_channel_layout)
+        if downmix_coefficients is None:
+            # noop layout, for example mono. no scales
+            print(f"no downmix for channel layout {input_channel_layout!r}")
+            input_channel_names = input_channel_names_by_layout["empty"]
         update_scale_dict()
 
     set_input_channel_layout(input_channel_layout)
@@ -535,9 +698,33 @@ def main():
         return 10**(value/precision)
 
     def update_scale_dict():
-        for frame_id in ["volume", "balance"]:
+        nonlocal audio_filter_template
+        # remove the scales of the previous layout
+        for scale in scale_dict.values():
+            scale.destroy()
+        scale_dict.clear()
+        channel_scales.clear()
+        # the channels of after_change are in the order of input_channel_names.names
+        terms = "+".join("%.6f*" + channel_name for channel_name in input_channel_names.names)
+        audio_filter_template = "pan=stereo|FL=" + terms + "|FR=" + terms
+        built_frames.clear()
+        balance_values.clear()
+        for channel_name in input_channel_names.names:
+            balance = get_config_value(downmix_config, "balance", channel_name)
+            if balance is None:
+                balance = get_channel_balance(downmix_coefficients, channel_name)
+            balance_values[channel_name] = balance
+        update_scale_dict_of_frame_id("volume")
+        if notebook.tab(notebook.select(), "text") == "balance":
+            update_scale_dict_of_frame_id("balance")
+
+    def on_notebook_tab_changed(event):
+        frame_id = notebook.tab(notebook.select(), "text")
+        if frame_id == "balance" and not frame_id in built_frames:
             update_scale_dict_of_frame_id(frame_id)
 
+    notebook.bind("<<NotebookTabChanged>>", on_notebook_tab_changed)
+
     def update_scale_dict_of_frame_id(frame_id):
         nonlocal scale_dict, downmix_coefficients, downmix_config
         frame = frame_dict[frame_id]
@@ -552,38 +739,59 @@ def main():
             from_ = -1
             to = 1
             get_init_value = get_channel_balance
-        for row_idx, row in enumerate(input_channel_names):
-            for col_idx, channel_name in enumerate(row):
-                if channel_name == None:
-                    continue
-                key = f"{frame_id}.{channel_name}"
+        built_frames.add(frame_id)
+        for (row_idx, col_idx), channel_name in zip(input_channel_names.positions, input_channel_names.names):
+            key = f"{frame_id}.{channel_name}"
+            if frame_id == "balance":
+                # the balance values can change before the balance tab is shown
+                init_value = balance_values[channel_name]
+            else:
                 init_value = get_config_value(downmix_config, frame_id, channel_name)
                 if init_value is None:
                     init_value = get_init_value(downmix_coefficients, channel_name)
-                #print(f"  {key} = {init_value}")
-                scale = tk_scale_debounced(
-                    frame,
-                    channel_name,
-                    after_change,
-                    on_change=on_change,
-                    key=key,
-                    get_value=get_value,
-                    set_value=set_value,
-                    format="%.3f",
-                    init_value=init_value,
-                    from_=from_,
-                    to=to,
-                    length=200,
-                )
-                scale.grid(column=col_idx, row=row_idx, padx=5, pady=5)
-                scale_dict[key] = scale
+            #print(f"  {key} = {init_value}")
+            scale = tk_scale_debounced(
+                frame,
+                channel_name,
+                after_change,
+                on_change=on_change,
+                key=key,
+                get_value=get_value,
+                set_value=set_value,
+                format="%.3f",
+                init_value=init_value,
+                from_=from_,
+                to=to,
+                length=200,
+            )
+            scale.grid(column=col_idx, row=row_idx, padx=5, pady=5)
+            scale_dict[key] = scale
+            channel_scales.setdefault(channel_name, {})[frame_id] = scale
 
     update_scale_dict()
 
 
 
+    # observer callbacks run in the ipc thread. tk is not thread-safe,
+    # so the ipc thread only queues the events, and the gui thread polls them
+    audio_track_queue = queue.Queue()
+
+    def change_audio_track_in_ipc_thread(name, track):
+        audio_track_queue.put((name, track))
+
+    def poll_audio_track_queue():
+        root_window.after(100, poll_audio_track_queue)
+        while True:
+            try:
+                name, track = audio_track_queue.get_nowait()
+            except queue.Empty:
+                break
+            change_audio_track(name, track)
+
+    root_window.after(100, poll_audio_track_queue)
+
     #observer_id =
-    mpv_ipc_client.bind_property_observer("current-tracks/audio", change_audio_track)
+    mpv_ipc_client.bind_property_observer("current-tracks/audio", change_audio_track_in_ipc_thread)
 
     for track in mpv_ipc_client.track_list:
         if track["type"] != "audio":
@@ -630,6 +838,21 @@ def main():
     if show_root_window:
         root_window.mainloop()
 
+    if gui_config:
+        # print the final values
+        print_downmix()
+
+    ipc_queue.put(None)
+    ipc_thread.join(1)
+
+    if isinstance(mpv_ipc_client_socket, socket.socket):
+        # drop pending data on close, dont wait for mpv to read it
+        try:
+            mpv_ipc_client_socket.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+        except OSError:
+            # linger is not supported for unix sockets on all kernels
+            pass
+
     mpv_ipc_client.quit()
     mpv_proc.kill()
 
@@ -644,7 +867,17 @@ def exit_handler():
     # stty is part of coreutils
     #subprocess.call(["stty", "sane"])
     # tput is part of ncurses
-    subprocess.call(["tput", "init"])
+    # no. "tput init" is slow, it forks a process on exit
+    #subprocess.call(["tput", "init"])
+    # write the xterm init string of "tput init" directly:
+    # soft reset (also shows the cursor), reset modes, normal keypad
+    if not sys.stdout.isatty():
+        return
+    try:
+        sys.stdout.write("\x1b[!p\x1b[?3;4l\x1b[4l\x1b>")
+        sys.stdout.flush()
+    except Exception:
+        pass
 
 
 
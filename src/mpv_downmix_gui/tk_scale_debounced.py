@@ -1,6 +1,132 @@
-import tkinter as tk
+import time
+import queue
+import threading
+import functools
+import traceback
 from tkinter import ttk
 
+def identity(value):
+    "default get_value and set_value"
+    return value
+
+def get_db_value_function(from_, to):
+    """
+    get_value for a scale in dB: 10**(raw/10)
+    with a resolution of 0.1 dB.
+    the values from_ to to are precomputed
+    """
+    start = round(from_ * 10)
+    table = [10**(i/100) for i in range(start, round(to * 10) + 1)]
+    def get_db_value(raw):
+        i = round(raw * 10)
+        if start <= i < start + len(table):
+            return table[i - start]
+        return 10**(i/100)
+    return get_db_value
+
+class ChangeBatcher:
+
+    """
+    collect after_change calls of many scales,
+    and run them once on the next idle tick of tk.
+    only the last value per key is passed to after_change
+
+    example:
+
+    batcher = ChangeBatcher(root)
+    s1 = tk_scale_debounced(root, "a", after_change, batcher=batcher)
+    s2 = tk_scale_debounced(root, "b", after_change, batcher=batcher)
+    """
+
+    def __init__(self, widget):
+        self._widget = widget
+        # {(after_change, key): value}
+        self._pending = dict()
+        self._scheduled = False
+
+    def push(self, after_change, key, value):
+        self._pending[(after_change, key)] = value
+        if not self._scheduled:
+            self._scheduled = True
+            self._widget.after_idle(self._flush)
+
+    def _flush(self):
+        pending = self._pending
+        self._pending = dict()
+        self._scheduled = False
+        for (after_change, key), value in pending.items():
+            after_change(key, value)
+
+class _KeyDebouncer:
+
+    """
+    keyboard debounce timer, shared by all scales of one toplevel.
+    one timer calls _scale_change_done of every scale
+    that had no keyboard input for its key_debounce_ms
+    """
+
+    @classmethod
+    def of(cls, widget):
+        root = widget._root()
+        debouncer = getattr(root, "_tk_scale_debounced_keys", None)
+        if debouncer is None:
+            debouncer = cls(root)
+            root._tk_scale_debounced_keys = debouncer
+        return debouncer
+
+    def __init__(self, root):
+        self._tk_call = root.tk.call
+        # the command belongs to the root, so it lives as long as the scales
+        self._poll_cmd = root._register(self._poll)
+        self._timer = None
+        self._timer_deadline = None
+        # scales with keyboard input since the last after_change: {id(scale): scale}
+        self._scales = dict()
+
+    def add(self, scale):
+        self._scales[id(scale)] = scale
+        deadline = scale._last_key_time + scale._key_debounce_ms / 1000
+        if self._timer is not None and deadline >= self._timer_deadline:
+            # the timer fires before this scale is due. dont restart the timer
+            return
+        self._schedule(deadline)
+
+    def remove(self, scale):
+        if self._scales.pop(id(scale), None) is None:
+            return
+        if not self._scales:
+            self._cancel()
+
+    def _schedule(self, deadline):
+        self._cancel()
+        t = max(0, int((deadline - time.monotonic()) * 1000) + 1)
+        self._timer_deadline = deadline
+        self._timer = self._tk_call('after', t, self._poll_cmd)
+
+    def _cancel(self):
+        if self._timer is not None:
+            self._tk_call('after', 'cancel', self._timer)
+            self._timer = None
+            self._timer_deadline = None
+
+    def _poll(self):
+        self._timer = None
+        self._timer_deadline = None
+        now = time.monotonic()
+        due = []
+        next_deadline = None
+        for scale_id, scale in list(self._scales.items()):
+            deadline = scale._last_key_time + scale._key_debounce_ms / 1000
+            if deadline <= now:
+                due.append(scale)
+                del self._scales[scale_id]
+            elif next_deadline is None or deadline < next_deadline:
+                next_deadline = deadline
+        if next_deadline is not None:
+            self._schedule(next_deadline)
+        for scale in due:
+            scale._scale_change_done()
+
 class tk_scale_debounced(ttk.Frame):
 
     """
@@ -10,6 +136,7 @@ class tk_scale_debounced(ttk.Frame):
 
     example:
 
+    import tkinter as tk
     def after_change(key, value):
         print(key, value)
     def get_value(value):
@@ -19,14 +146,17 @@ class tk_scale_debounced(ttk.Frame):
         root, "some label", after_change, key="x",
         get_value=get_value, from_=-10, to=10
     )
+    # same, with precomputed values
+    s = tk_scale_debounced(
+        root, "some label", after_change, key="x",
+        get_value="db", from_=-10, to=10
+    )
     s.pack()
     """
 
-    # current value
-    value = None
-
-    # debounce timer for keyboard input
-    _change_key_timer = None
+    # worker thread for after_change_async, shared by all scales
+    _worker_queue = queue.SimpleQueue()
+    _worker_thread = None
 
     def __init__(
             self,
@@ -35,93 +165,318 @@ class tk_scale_debounced(ttk.Frame):
             after_change, # lambda key, value: None
             on_change=None, # lambda key, value: None
             key=None,
-            get_value=lambda x: x,
-            set_value=lambda x: x,
+            get_value=identity,
+            set_value=identity,
             init_value=0.0,
             from_=0,
             to=1,
             format="%.2f",
+            live_throttle_ms=30,
+            leading=True,
+            trailing=True,
+            drag_interval_ms=16,
+            batcher=None,
+            key_debounce_ms=150,
+            after_change_async=False,
             **scale_kwargs
         ):
 
         """
+        get_value: function raw -> value, or "db" for 10**(raw/10)
+        with a resolution of 0.1 dB
+
         example scale_kwargs:
 
         from_=-10, to=10, orient='horizontal'
+
+        live_throttle_ms: minimum time between two live updates
+        of the value label and on_change, for example from keyboard input.
+        0 = no throttle
+
+        leading: update on the first change of a throttle interval
+
+        trailing: update at the end of a throttle interval,
+        when the value has changed during the interval.
+        on mouse release, the last value is always applied
+
+        drag_interval_ms: while dragging with the mouse, apply the last value
+        once per interval, instead of the throttle. default: 16 = 60 fps
+
+        batcher: ChangeBatcher, to call after_change once per idle tick
+
+        key_debounce_ms: call after_change when there was no keyboard input
+        for this time
+
+        after_change_async: call after_change in a worker thread,
+        so slow work like ipc does not block the gui.
+        after_change must not use tk. the calls keep their order
         """
 
         super().__init__(parent)
 
+        # timers: call tcl "after" directly.
+        # Misc.after would register a new tcl command for every call
+        self._tk_call = self.tk.call
+        self._flush_live_cmd = self._register(self._flush_live)
+        self._drain_drag_cmd = self._register(self._drain_drag)
+        self._check_key_release_cmd = self._register(self._check_key_release)
+        self._apply_label_cmd = self._register(self._apply_label)
+
+        # keysym of a KeyRelease event, until we know it was not a key repeat
+        self._key_release_pending = None
+        # time of the last keyboard input
+        self._last_key_time = 0.0
+        # "after idle" ids, to cancel them in destroy
+        self._apply_label_idle = None
+        self._check_key_release_idle = None
+
+        if after_change_async:
+            after_change = functools.partial(self._run_in_worker, after_change)
         self._after_change = after_change
         self._on_change = on_change
         self._label = label
         self._key = key or label
+        if get_value == "db":
+            get_value = get_db_value_function(set_value(from_), set_value(to))
         self._get_value = get_value
         self._set_value = set_value
-        self._format = format
+        # fast paths: None = identity
+        self._fast_get = None if get_value is identity else get_value
+        self._fast_set = None if set_value is identity else set_value
+        # last result of get_value. while dragging, the raw value often repeats
+        self._cached_raw = None
+        self._cached_value = None
+        # parse the format string only once
+        self._fmt = format.__mod__
         self._init_value = init_value
         self._from = from_
         self._to = to
         self._last_value = self._init_value
+        self._live_throttle_ms = live_throttle_ms
+        self._live_timer = None
+        self._live_pending = False
+        self._leading = leading
+        self._trailing = trailing
+        self._drag_interval_ms = drag_interval_ms
+        self._dragging = False
+        self._drag_timer = None
+        self._batcher = batcher
+        self._key_debounce_ms = key_debounce_ms
 
-        self.value = tk.DoubleVar()
-        self.value.set(self._set_value(self._init_value))
+        # raw value of the scale. no tk.DoubleVar, the scale passes the value to command
+        self._last_raw = self._set_value(self._init_value)
 
-        #print(f"set init: {self._key}: {self._init_value} -> {self._set_value(self._init_value)} -> {self.value.get()}")
+        # raw value of the last live update
+        self._live_raw = self._last_raw
+        # raw value of the last _scale_change_done
+        self._done_raw = self._last_raw
+
+        #print(f"set init: {self._key}: {self._init_value} -> {self._set_value(self._init_value)} -> {self._last_raw}")
 
         #self.columnconfigure(0, weight=2)
         #self.columnconfigure(1, weight=1)
         #self.columnconfigure(2, weight=100)
 
         # label
-        self._scale_label = ttk.Label(self, text=self._label)
-        self._scale_label.grid(column=0, row=0, sticky='w')
+        self._scale_label = ttk.Label(self, text=self._label, anchor='w')
 
         # value
-        self._value_label = ttk.Label(self, text=self._format_value())
-        self._value_label.grid(column=1, row=0, sticky='e')
+        self._last_text = self._fmt(self._value(self._last_raw))
+        # width of the values at the bounds, so tk does not change the layout
+        # when the text changes. negative: minimum width, longer text is not clipped
+        width = -max(
+            len(self._fmt(self._get_value(self._set_value(self._from)))),
+            len(self._fmt(self._get_value(self._set_value(self._to)))),
+            len(self._last_text),
+        )
+        self._value_label = ttk.Label(self, text=self._last_text, width=width, anchor='e')
+        # set the text with a direct tcl call, without the option parsing of configure
+        self._value_label_w = str(self._value_label)
+        # the label is updated on the next idle tick
+        self._label_dirty = False
 
         #  scale
         self._scale = ttk.Scale(
             self,
             command=self._scale_change_live,
-            variable=self.value,
+            # no variable. the scale passes the value to command
+            value=self._last_raw,
             from_=self._set_value(self._from),
             to=self._set_value(self._to),
             **scale_kwargs
         )
-        #self._scale.grid(column=2, row=0, columnspan=2, sticky='we')
-        self._scale.grid(column=0, row=1, columnspan=2, sticky='we')
         #self._scale.set(self._set_value(self._init_value))
 
+        # grid: one call per row. the labels fill their cells,
+        # so their anchor aligns the text left and right.
+        # "-" extends the scale over the second column
+        self._tk_call('grid', 'configure', self._scale_label, self._value_label,
+            '-row', 0, '-sticky', 'we')
+        self._tk_call('grid', 'configure', self._scale, '-',
+            '-row', 1, '-sticky', 'we')
+
         # mouse
-        self._scale.bind("<ButtonRelease-1>", self._scale_change_done)
+        self._scale.bind("<ButtonPress-1>", self._scale_press)
+        self._scale.bind("<ButtonRelease-1>", self._scale_release)
         # keyboard
-        self._scale.bind("<KeyRelease>", self._scale_change_key)
+        self._scale.bind("<KeyPress>", self._scale_key_press)
+        self._scale.bind("<KeyRelease>", self._scale_key_release)
+
+    @classmethod
+    def _run_in_worker(cls, func, *args):
+        if cls._worker_thread is None:
+            cls._worker_thread = threading.Thread(target=cls._worker_loop, daemon=True)
+            cls._worker_thread.start()
+        cls._worker_queue.put((func, args))
+
+    @classmethod
+    def _worker_loop(cls):
+        while True:
+            func, args = cls._worker_queue.get()
+            try:
+                func(*args)
+            except Exception:
+                traceback.print_exc()
 
     def get(self):
-        return self._get_value(self.value.get())
+        return self._value(self._last_raw)
 
     def set(self, value):
-        self.value.set(self._set_value(value))
-        self._value_label.configure(text=self._format_value())
+        self._last_raw = value if self._fast_set is None else self._fast_set(value)
+        # configure does not call command, Scale.set would call command
+        self._scale.configure(value=self._last_raw)
+        self._update_label(self._value(self._last_raw))
+
+    def _value(self, raw):
+        "get_value(raw), with fast paths for identity and repeated raw values"
+        if raw == self._cached_raw:
+            return self._cached_value
+        value = raw if self._fast_get is None else self._fast_get(raw)
+        self._cached_raw = raw
+        self._cached_value = value
+        return value
+
+    def _update_label(self, value):
+        text = self._fmt(value)
+        if text == self._last_text:
+            # many raw values have the same formatted value
+            return
+        self._last_text = text
+        if not self._label_dirty:
+            # collect all changes until the next idle tick
+            self._label_dirty = True
+            self._apply_label_idle = self._tk_call('after', 'idle', self._apply_label_cmd)
+
+    def _apply_label(self):
+        self._apply_label_idle = None
+        self._label_dirty = False
+        self._tk_call(self._value_label_w, 'configure', '-text', self._last_text)
+
+    def _scale_change_live(self, raw):
+        # the scale passes the new value as string
+        self._last_raw = float(raw)
+        if self._dragging:
+            # _drain_drag applies the value
+            return
+        if self._live_throttle_ms <= 0:
+            self._update_live()
+            return
+        if self._live_timer is not None:
+            # throttle: update once at the end of the interval
+            self._live_pending = self._trailing
+            return
+        if self._leading:
+            self._update_live()
+        else:
+            self._live_pending = self._trailing
+        self._live_timer = self._tk_call('after', self._live_throttle_ms, self._flush_live_cmd)
+
+    def _flush_live(self):
+        self._live_timer = None
+        if not self._live_pending:
+            return
+        self._live_pending = False
+        self._update_live()
+        self._live_timer = self._tk_call('after', self._live_throttle_ms, self._flush_live_cmd)
 
-    def _format_value(self):
-        return self._format % self._get_value(self.value.get())
+    def _scale_press(self, event):
+        self._dragging = True
+        if self._drag_timer is None:
+            self._drag_timer = self._tk_call('after', self._drag_interval_ms, self._drain_drag_cmd)
 
-    def _scale_change_live(self, event):
-        self._value_label.configure(text=self._format_value())
+    def _drain_drag(self):
+        self._drag_timer = None
+        if not self._dragging:
+            return
+        if self._last_raw != self._live_raw:
+            self._update_live()
+        self._drag_timer = self._tk_call('after', self._drag_interval_ms, self._drain_drag_cmd)
+
+    def _scale_release(self, event):
+        self._dragging = False
+        if self._drag_timer is not None:
+            self._tk_call('after', 'cancel', self._drag_timer)
+            self._drag_timer = None
+        # the value of the release is final, dont wait for the throttle
+        if self._live_timer is not None:
+            self._tk_call('after', 'cancel', self._live_timer)
+            self._live_timer = None
+        self._live_pending = False
+        if self._last_raw != self._live_raw:
+            self._update_live()
+        self._scale_change_done()
+
+    def _update_live(self):
+        self._live_raw = self._last_raw
+        value = self._value(self._last_raw)
+        self._update_label(value)
         if self._on_change:
-            self._on_change(self._key, self._get_value(self.value.get()))
+            self._on_change(self._key, value)
 
     def _scale_change_done(self, event=None):
-        value = self._get_value(self.value.get())
+        raw = self._last_raw
+        if raw == self._done_raw:
+            # no change since the last call, for example a click without drag
+            return
+        self._done_raw = raw
+        value = self._value(raw)
         if value != self._last_value:
-            self._after_change(self._key, value)
+            if self._batcher:
+                self._batcher.push(self._after_change, self._key, value)
+            else:
+                self._after_change(self._key, value)
             self._last_value = value
 
+    def _scale_key_press(self, event):
+        self._last_key_time = time.monotonic()
+        if self._key_release_pending == event.keysym:
+            # key repeat sends KeyRelease + KeyPress. ignore the KeyRelease
+            self._key_release_pending = None
+
+    def _scale_key_release(self, event):
+        self._key_release_pending = event.keysym
+        if self._check_key_release_idle is None:
+            self._check_key_release_idle = self._tk_call('after', 'idle', self._check_key_release_cmd)
+
+    def _check_key_release(self):
+        self._check_key_release_idle = None
+        if self._key_release_pending is None:
+            return
+        self._key_release_pending = None
+        self._scale_change_key(None)
+
     def _scale_change_key(self, event):
-        if self._change_key_timer:
-            self.after_cancel(self._change_key_timer)
-        t = 1000
-        self._change_key_timer = self.after(t, self._scale_change_done)
+        # dont restart the timer on every key. the timer checks the idle time.
+        # one timer is used for all scales of the toplevel
+        self._last_key_time = time.monotonic()
+        _KeyDebouncer.of(self).add(self)
+
+    def destroy(self):
+        _KeyDebouncer.of(self).remove(self)
+        for timer in (self._live_timer, self._drag_timer,
+                self._apply_label_idle, self._check_key_release_idle):
+            if timer is not None:
+                self._tk_call('after', 'cancel', timer)
+        self._live_timer = self._drag_timer = None
+        self._apply_label_idle = self._check_key_release_idle = None
+        super().destroy()